@@ -1,11 +1,18 @@
 # app.py
+import io
+import os
+import tempfile
+import warnings
 import streamlit as st
 import pandas as pd
+import polars as pl
 import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 from streamlit_option_menu import option_menu
 
-DATA_PATH = "data/fpma_indonesia_monthly_clean_long_with_oil.csv"
+CSV_PATH = "data/fpma_indonesia_monthly_clean_long_with_oil.csv"
+DATA_PATH = "data/fpma_indonesia_monthly_clean_long_with_oil.parquet"
 
 st.set_page_config(
     page_title="Dashboard Harga Bahan Pokok Indonesia",
@@ -15,9 +22,9 @@ st.set_page_config(
 # =========================
 # LOAD & PREP DATA
 # =========================
-@st.cache_data
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def migrate_csv_to_parquet(csv_path: str, parquet_path: str) -> None:
+    # Migrasi satu kali: CSV mentah -> Parquet dengan tipe kolom yang sudah pasti
+    df = pd.read_csv(csv_path)
     df.columns = [c.strip().lower() for c in df.columns]
 
     required = {"date", "commodity", "price"}
@@ -46,30 +53,258 @@ def load_data(path: str) -> pd.DataFrame:
         df["unit"] = df["unit"].astype(str).str.strip()
 
     df = df.sort_values(["commodity", "date"]).reset_index(drop=True)
+    df = df.astype({
+        "date": "datetime64[ns]",
+        "price": "float64",
+        "commodity": "category",
+        "currency": "category",
+        "unit": "category",
+    })
+    # Tulis ke file sementara lalu os.replace: sesi lain tidak pernah membaca file setengah jadi
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(parquet_path) or ".", suffix=".tmp.parquet")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+        os.replace(tmp_path, parquet_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def ensure_parquet(csv_path: str, parquet_path: str) -> None:
+    # CSV satu-satunya sumber data (Parquet tidak di-commit): Parquet dibangun
+    # ulang bila belum ada atau CSV lebih baru
+    if os.path.exists(parquet_path) and (
+        not os.path.exists(csv_path)
+        or os.path.getmtime(csv_path) <= os.path.getmtime(parquet_path)
+    ):
+        return
+    migrate_csv_to_parquet(csv_path, parquet_path)
+
+
+# persist="disk": hasil parsing tetap ada setelah proses/worker di-restart;
+# mtime ikut menjadi kunci cache agar file Parquet yang diperbarui terbaca ulang
+@st.cache_data(persist="disk", show_spinner="Memuat data...")
+def load_data(path: str, mtime: float) -> tuple:
+    # Tipe kolom (date, price, kategori) sudah dijamin oleh skema Parquet
+    df = pd.read_parquet(path, engine="pyarrow")
+
+    # Jaga-jaga bila file Parquet ditulis tanpa dtype kategori
+    for col in ("commodity", "currency", "unit"):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str).str.strip().astype("category")
+
     df["year"] = df["date"].dt.year
     df["month"] = df["date"].dt.month
-    return df
+
+    # MoM/YoY dihitung sekali pada data penuh; filter diterapkan setelahnya
+    # reset_index: urutan index = urutan (commodity, date), dipakai filter_data & latest_prices
+    df = add_changes(df).reset_index(drop=True)
+
+    # Daftar komoditas & rentang tanggal ikut di-cache (cat.categories: O(#kategori)).
+    # Tuple biasa, bukan kelas dari modul skrip: kelas itu dibuat ulang tiap run
+    # sehingga pickle cache_data bisa gagal
+    commodities = sorted(df["commodity"].cat.categories.tolist())
+    return df, commodities, df["date"].min(), df["date"].max()
 
 
 def add_changes(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.sort_values(["commodity", "date"]).copy()
-    out["mom_pct"] = out.groupby("commodity")["price"].pct_change(1) * 100
-    out["yoy_pct"] = out.groupby("commodity")["price"].pct_change(12) * 100
-    return out
+    # sort_values sudah menghasilkan objek baru; tidak perlu .copy()
+    out = df.sort_values(["commodity", "date"])
+    # Window expression Polars per komoditas (paralel antar grup)
+    changes = (
+        pl.from_pandas(out[["commodity", "price"]])
+        .with_columns([
+            (pl.col("price").pct_change(1).over("commodity") * 100).alias("mom_pct"),
+            (pl.col("price").pct_change(12).over("commodity") * 100).alias("yoy_pct"),
+        ])
+    )
+    return out.assign(
+        mom_pct=changes["mom_pct"].to_numpy(),
+        yoy_pct=changes["yoy_pct"].to_numpy(),
+    )
+
+
+# cache_resource: frame hanya dibaca & dipakai bersama, jadi tidak perlu
+# di-unpickle ulang di setiap rerun seperti cache_data. max_entries=1: frame
+# versi data lama dibuang saat mtime berubah
+@st.cache_resource(max_entries=1)
+def load_data_by_date(path: str, mtime: float) -> pd.DataFrame:
+    # Salinan terurut per tanggal agar rentang waktu bisa di-slice dengan searchsorted
+    df, _, _, _ = load_data(path, mtime)
+    return df.sort_values("date", kind="stable")
 
 
-def filter_data(df: pd.DataFrame, selected_commodities, start_date, end_date) -> pd.DataFrame:
-    return df[
-        (df["commodity"].isin(selected_commodities)) &
-        (df["date"] >= start_date) &
-        (df["date"] <= end_date)
-    ].copy()
+@st.cache_resource(max_entries=1)
+def load_filter_options(path: str, mtime: float) -> tuple:
+    # Halaman hanya butuh nilai kecil ini; cache_resource agar frame penuh dari
+    # load_data tidak di-unpickle di setiap rerun
+    _, commodities, min_date, max_date = load_data(path, mtime)
+    return commodities, min_date, max_date
+
+
+def filter_data(df_by_date: pd.DataFrame, selected_commodities, start_date, end_date) -> pd.DataFrame:
+    lo = df_by_date["date"].searchsorted(start_date, side="left")
+    hi = df_by_date["date"].searchsorted(end_date, side="right")
+    sub = df_by_date.iloc[lo:hi]
+    sub = sub[sub["commodity"].isin(frozenset(selected_commodities))]
+    # Kembalikan ke urutan (commodity, date) seperti hasil load_data
+    return sub.sort_index()
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+    return buf.getvalue()
+
+
+# =========================
+# INFORMASI STRATEGIS: DATA & FIGURE
+# filter_key = (tuple komoditas, start_date, end_date)
+# data_version = mtime file Parquet; ikut menjadi kunci cache agar hasil lama
+# tidak dipakai lagi setelah data diperbarui
+# =========================
+def filtered_data(filter_key, data_version: float) -> pd.DataFrame:
+    selected_commodities, start_date, end_date = filter_key
+    df_by_date = load_data_by_date(DATA_PATH, data_version)
+    return filter_data(df_by_date, selected_commodities, start_date, end_date)
+
+
+# Data tiap menu di-cache terpisah per filter_key: berpindah menu dengan filter
+# yang sama cukup mengambil hasil yang sudah ada
+@st.cache_data(max_entries=16, show_spinner=False)
+def recent_mom(filter_key, data_version: float) -> pd.DataFrame:
+    dfx = filtered_data(filter_key, data_version)
+    # Ambil 12 bulan terakhir per komoditas
+    return (
+        dfx.sort_values("date")
+        .groupby("commodity", sort=False, observed=True)
+        .tail(12)
+        .dropna(subset=["mom_pct"])
+    )
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def peak_mom(filter_key, data_version: float) -> pd.DataFrame:
+    dfx = filtered_data(filter_key, data_version)
+    peak_idx = dfx.dropna(subset=["mom_pct"]).groupby("commodity", sort=False, observed=True)["mom_pct"].idxmax()
+    peak_df = (
+        dfx.loc[peak_idx, ["commodity", "date", "mom_pct", "price"]]
+        .rename(columns={
+            "commodity": "Komoditas",
+            "date": "Bulan",
+            "mom_pct": "Lonjakan MoM (%)",
+            "price": "Harga saat itu",
+        })
+        .reset_index(drop=True)
+    )
+    peak_df["Bulan"] = peak_df["Bulan"].dt.strftime("%Y-%m")
+    return peak_df.sort_values("Lonjakan MoM (%)", ascending=False)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def latest_prices(filter_key, data_version: float) -> pd.DataFrame:
+    df_f = filtered_data(filter_key, data_version)
+    # df_f terurut (commodity, date) dari load_data: baris terakhir tiap komoditas = harga terbaru
+    last = df_f.drop_duplicates("commodity", keep="last")[["commodity", "date", "price", "currency", "unit"]]
+    return last.sort_values("price", ascending=False)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def before_after(filter_key, data_version: float, pivot_year: int):
+    df_f = filtered_data(filter_key, data_version)
+    # Fase sebagai Categorical (kode int8); baris tahun pemisah jatuh ke "_pivot"
+    # yang langsung dibuang sehingga menjadi NaN
+    fase = pd.cut(
+        df_f["year"],
+        bins=[-np.inf, pivot_year - 1, pivot_year, np.inf],
+        labels=[f"Sebelum {pivot_year}", "_pivot", f"Sesudah {pivot_year}"],
+    ).cat.remove_categories("_pivot")
+    # df_f tidak diubah di tempat: assign mengembalikan frame baru dengan kolom fase
+    tmp = df_f.assign(fase=fase).dropna(subset=["fase"])
+
+    counts = tmp.groupby("fase", observed=True)["price"].count().reset_index(name="jumlah_data")
+
+    fases = [f"Sebelum {pivot_year}", f"Sesudah {pivot_year}"]
+    pivot_tbl = (
+        tmp.pivot_table(index="commodity", columns="fase", values="price", aggfunc="mean", observed=True)
+        .reindex(columns=fases)
+    )
+    agg_full = pivot_tbl.reset_index().melt(id_vars="commodity", var_name="fase", value_name="price")
+
+    denom = pivot_tbl[fases[0]].replace({0: np.nan})
+    pivot_tbl["Perubahan (%)"] = ((pivot_tbl[fases[1]] - pivot_tbl[fases[0]]) / denom) * 100
+    pivot_tbl["Perubahan (%)"] = pivot_tbl["Perubahan (%)"].round(2)
+    return counts, agg_full, pivot_tbl
+
+
+# Figure di-cache per kombinasi filter: perpindahan menu/tab cukup menampilkan ulang
+# figure yang sudah jadi
+@st.cache_resource(max_entries=16)
+def build_stabilitas_fig(filter_key, data_version: float) -> go.Figure:
+    recent = recent_mom(filter_key, data_version)
+
+    # Trace WebGL (scattergl) agar render di browser tetap ringan
+    fig = go.Figure()
+    for c, g in recent.groupby("commodity", sort=False, observed=True):
+        fig.add_trace(go.Scattergl(x=g["date"], y=g["mom_pct"], mode="lines+markers", name=c))
+
+    fig.add_hline(y=0, line_dash="dash")
+
+    fig.update_layout(
+        title="Stabilitas Harga (Naik-Turun MoM 12 Bulan Terakhir)",
+        xaxis_title="Tanggal",
+        yaxis_title="Perubahan MoM (%)",
+        legend_title_text="Komoditas"
+    )
+    return fig
+
+
+@st.cache_resource(max_entries=16)
+def build_lonjakan_fig(filter_key, data_version: float) -> go.Figure:
+    peak_df = peak_mom(filter_key, data_version)
+
+    fig = px.bar(peak_df, x="Komoditas", y="Lonjakan MoM (%)", title="Lonjakan Bulanan Terbesar per Komoditas")
+    fig.add_hline(y=0)
+    fig.update_layout(xaxis_title="Komoditas", yaxis_title="MoM (%)")
+    return fig
+
+
+@st.cache_resource(max_entries=16)
+def build_harga_terbaru_fig(filter_key, data_version: float) -> go.Figure:
+    last = latest_prices(filter_key, data_version)
+
+    fig = px.bar(last, x="commodity", y="price", title="Harga Terbaru per Komoditas")
+    fig.update_layout(xaxis_title="Komoditas", yaxis_title="Harga (sesuai satuan)")
+    return fig
+
+
+@st.cache_resource(max_entries=16)
+def build_sebelum_sesudah_fig(filter_key, data_version: float, pivot_year: int) -> go.Figure:
+    _, agg_full, _ = before_after(filter_key, data_version, pivot_year)
+
+    fig = px.bar(
+        agg_full,
+        x="commodity",
+        y="price",
+        color="fase",
+        barmode="group",
+        title=f"Rata-rata Harga: Sebelum vs Sesudah {pivot_year}"
+    )
+    fig.update_layout(xaxis_title="Komoditas", yaxis_title="Rata-rata Harga (sesuai satuan)")
+    return fig
 
 
 # =========================
 # APP START
 # =========================
-df = load_data(DATA_PATH)
+ensure_parquet(CSV_PATH, DATA_PATH)
+data_version = os.path.getmtime(DATA_PATH)
+commodities, min_date, max_date = load_filter_options(DATA_PATH, data_version)
 
 # =========================
 # SIDEBAR MENU (MODERN)
@@ -120,10 +355,6 @@ with st.expander("Sumber Data & Catatan", expanded=False):
 # =========================
 # FILTER UTAMA (MAIN)
 # =========================
-commodities = sorted(df["commodity"].unique().tolist())
-min_date = df["date"].min()
-max_date = df["date"].max()
-
 with st.expander("Filter Data (Komoditas & Rentang Waktu)", expanded=True):
     c1, c2 = st.columns([2, 2])
 
@@ -145,13 +376,12 @@ with st.expander("Filter Data (Komoditas & Rentang Waktu)", expanded=True):
 start_date = pd.to_datetime(date_range[0])
 end_date = pd.to_datetime(date_range[1])
 
-df_f = filter_data(df, selected_commodities, start_date, end_date)
+filter_key = (tuple(selected_commodities), start_date, end_date)
+df_f = filtered_data(filter_key, data_version)
 if df_f.empty:
     st.warning("Tidak ada data pada filter yang dipilih. Pilih komoditas atau ubah rentang tanggal.")
     st.stop()
 
-dfx = add_changes(df_f)
-
 # =========================
 # TABS
 # =========================
@@ -168,44 +398,30 @@ with tab1:
         st.write("Menunjukkan seberapa sering harga **naik-turun (MoM)** dalam 12 bulan terakhir.")
         st.caption("Semakin zig-zag garisnya, semakin tidak stabil harganya.")
 
-        # Ambil 12 bulan terakhir per komoditas
-        recent = (
-            dfx.sort_values("date")
-            .groupby("commodity")
-            .tail(12)
-            .dropna(subset=["mom_pct"])
-        )
+        recent = recent_mom(filter_key, data_version)
 
         if recent.empty:
             st.warning("Data MoM belum cukup (butuh minimal 2 bulan data).")
             st.stop()
 
         # ===== LINE CHART =====
-        fig = px.line(
-            recent,
-            x="date",
-            y="mom_pct",
-            color="commodity",
-            markers=True,
-            title="Stabilitas Harga (Naik-Turun MoM 12 Bulan Terakhir)"
-        )
-
-        fig.add_hline(y=0, line_dash="dash")
-
-        fig.update_layout(
-            xaxis_title="Tanggal",
-            yaxis_title="Perubahan MoM (%)"
-        )
-
+        fig = build_stabilitas_fig(filter_key, data_version)
         st.plotly_chart(fig, use_container_width=True)
 
         # ===== Ringkasan Stabilitas =====
-        vol = (
-            recent.groupby("commodity")["mom_pct"]
-            .std()
-            .reset_index(name="volatilitas")
-            .sort_values("volatilitas", ascending=False)
-        )
+        # Matriks (tanggal x komoditas) -> satu reduksi nanstd per kolom.
+        # pivot_table (bukan pivot) agar baris ganda (date, commodity), misalnya dari
+        # beberapa pasar, tidak membuat ValueError
+        mom_mat = recent.pivot_table(index="date", columns="commodity", values="mom_pct", observed=True)
+        # Komoditas dengan satu observasi menghasilkan NaN (sama seperti groupby().std());
+        # RuntimeWarning "Degrees of freedom <= 0" dari nanstd diredam
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            volatilitas = np.nanstd(mom_mat.to_numpy(), axis=0, ddof=1)
+        vol = pd.DataFrame({
+            "commodity": mom_mat.columns,
+            "volatilitas": volatilitas,
+        }).sort_values("volatilitas", ascending=False)
 
         if not vol.empty:
             top = vol.iloc[0]
@@ -222,20 +438,9 @@ with tab1:
         st.write("Mencari bulan dengan **lonjakan terbesar dibanding bulan sebelumnya (MoM)** untuk tiap komoditas.")
         st.caption("MoM = perubahan dibanding bulan sebelumnya.")
 
-        peak_list = []
-        for c, grp in dfx.groupby("commodity"):
-            g = grp.dropna(subset=["mom_pct"]).sort_values("mom_pct", ascending=False)
-            if g.empty:
-                continue
-            peak = g.iloc[0]
-            peak_list.append([c, peak["date"].strftime("%Y-%m"), float(peak["mom_pct"]), float(peak["price"])])
-
-        peak_df = pd.DataFrame(peak_list, columns=["Komoditas", "Bulan", "Lonjakan MoM (%)", "Harga saat itu"])
-        peak_df = peak_df.sort_values("Lonjakan MoM (%)", ascending=False)
+        peak_df = peak_mom(filter_key, data_version)
 
-        fig = px.bar(peak_df, x="Komoditas", y="Lonjakan MoM (%)", title="Lonjakan Bulanan Terbesar per Komoditas")
-        fig.add_hline(y=0)
-        fig.update_layout(xaxis_title="Komoditas", yaxis_title="MoM (%)")
+        fig = build_lonjakan_fig(filter_key, data_version)
         st.plotly_chart(fig, use_container_width=True)
 
         st.markdown("**Detail (tabel):**")
@@ -253,14 +458,11 @@ with tab1:
     elif info_choice == "Harga Terbaru (Saat Ini)":
         st.write("Menampilkan **harga terakhir** untuk tiap komoditas (mengikuti satuan masing-masing).")
 
-        latest_idx = df_f.groupby("commodity")["date"].idxmax()
-        last = df_f.loc[latest_idx, ["commodity", "date", "price", "currency", "unit"]].copy()
-        last = last.sort_values("price", ascending=False)
+        last = latest_prices(filter_key, data_version)
 
         colA, colB = st.columns([2, 1])
         with colA:
-            fig = px.bar(last, x="commodity", y="price", title="Harga Terbaru per Komoditas")
-            fig.update_layout(xaxis_title="Komoditas", yaxis_title="Harga (sesuai satuan)")
+            fig = build_harga_terbaru_fig(filter_key, data_version)
             st.plotly_chart(fig, use_container_width=True)
 
         with colB:
@@ -279,38 +481,14 @@ with tab1:
         default_idx = years.index(2021) if 2020 in years else 0
         pivot_year = st.selectbox("Pilih tahun pemisah", options=years, index=default_idx)
 
-        tmp = df_f.copy()
-        tmp["fase"] = np.where(tmp["year"] < pivot_year, f"Sebelum {pivot_year}", f"Sesudah {pivot_year}")
-        tmp = tmp[tmp["year"] != pivot_year]
+        counts, _, pivot_tbl = before_after(filter_key, data_version, pivot_year)
 
-        counts = tmp.groupby("fase")["price"].count().reset_index(name="jumlah_data")
         st.caption("Cek ketersediaan data (biar jelas kalau salah satu bar tidak muncul):")
         st.dataframe(counts, use_container_width=True)
 
-        agg = tmp.groupby(["commodity", "fase"], as_index=False)["price"].mean()
-
-        all_comms = sorted(tmp["commodity"].unique().tolist())
-        fases = [f"Sebelum {pivot_year}", f"Sesudah {pivot_year}"]
-        grid = pd.MultiIndex.from_product([all_comms, fases], names=["commodity", "fase"]).to_frame(index=False)
-        agg_full = grid.merge(agg, on=["commodity", "fase"], how="left")
-
-        fig = px.bar(
-            agg_full,
-            x="commodity",
-            y="price",
-            color="fase",
-            barmode="group",
-            title=f"Rata-rata Harga: Sebelum vs Sesudah {pivot_year}"
-        )
-        fig.update_layout(xaxis_title="Komoditas", yaxis_title="Rata-rata Harga (sesuai satuan)")
+        fig = build_sebelum_sesudah_fig(filter_key, data_version, pivot_year)
         st.plotly_chart(fig, use_container_width=True)
 
-        pivot_tbl = agg_full.pivot(index="commodity", columns="fase", values="price")
-        if set(fases).issubset(pivot_tbl.columns):
-            denom = pivot_tbl[fases[0]].replace({0: np.nan})
-            pivot_tbl["Perubahan (%)"] = ((pivot_tbl[fases[1]] - pivot_tbl[fases[0]]) / denom) * 100
-            pivot_tbl["Perubahan (%)"] = pivot_tbl["Perubahan (%)"].round(2)
-
         st.markdown("**Detail (tabel):**")
         st.dataframe(pivot_tbl.reset_index(), use_container_width=True)
 
@@ -327,11 +505,17 @@ with tab2:
     st.subheader("Data (Setelah Filter)")
     st.dataframe(df_f, use_container_width=True)
 
-    csv_out = df_f.to_csv(index=False).encode("utf-8")
+    # File baru dibuat saat tombol diklik, bukan di setiap rerun
     st.download_button(
         label="Download data hasil filter (CSV)",
-        data=csv_out,
+        data=lambda data=df_f: to_csv_bytes(data),
         file_name="fpma_filtered.csv",
         mime="text/csv"
     )
+    st.download_button(
+        label="Download data hasil filter (Parquet)",
+        data=lambda data=df_f: to_parquet_bytes(data),
+        file_name="fpma_filtered.parquet",
+        mime="application/vnd.apache.parquet"
+    )
 